@@ -1,10 +1,22 @@
 # app/__init__.py
 
 from flask import Flask, request
+import asyncio
 import os
 import logging
 from datetime import timedelta
 
+# Use the native upb protobuf backend; must be set before google.protobuf is imported.
+os.environ.setdefault("PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION", "upb")
+
+# Use libuv-backed event loops for async views and the shared IO loop where available.
+# set_event_loop_policy is deprecated from Python 3.14, but it's the only hook here:
+# asgiref creates the per-request loops itself, so there is no loop_factory to pass.
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
 
 from .token_manager import TokenCache, get_headers 
 from .like_routes import like_bp, initialize_routes 
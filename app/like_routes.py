@@ -1,9 +1,18 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request
 import asyncio
-from datetime import datetime, timezone
+import atexit
+import concurrent.futures
+import hashlib
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Optional
 import logging
 import aiohttp
-import requests
+import orjson
+from cachetools import TLRUCache, TTLCache
 
 from .utils.protobuf_utils import encode_uid, decode_info, create_protobuf
 from .utils.crypto_utils import encrypt_aes
@@ -15,49 +24,304 @@ logger = logging.getLogger(__name__)
 like_bp = Blueprint("like_bp", __name__)
 
 _SERVERS = {}
+_INFO_URLS = {}
+_LIKE_URLS = {}
+_SEND_LIKES = {}
 _token_cache = None
 
+# Flask runs each async view on its own short-lived event loop, so the shared
+# session lives on a dedicated long-lived loop and requests are handed to it.
+_IO_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_IO_LOCK = threading.Lock()
+_SESSION: Optional[aiohttp.ClientSession] = None
+SESSION_TIMEOUT = 10
+
+# UID -> region it was last found on, so repeat UIDs skip detection.
+# Each entry's TTL gets +/-10% jitter so entries cached together don't all expire together.
+UID_REGION_TTL = timedelta(minutes=10).seconds
+UID_REGION_TTL_JITTER = 0.1
+UID_REGION_MAXSIZE = 10000
+
+
+def _uid_region_ttu(_key, _value, now):
+    return now + UID_REGION_TTL * random.uniform(1 - UID_REGION_TTL_JITTER, 1 + UID_REGION_TTL_JITTER)
+
+
+_uid_region_cache = TLRUCache(maxsize=UID_REGION_MAXSIZE, ttu=_uid_region_ttu)
+_uid_region_lock = threading.Lock()
+
+# UID -> (region, nickname, likes, tokens_spent, checked_at) from the last post-send
+# reconcile. tokens_spent means accepted LikeProfile posts didn't move the count,
+# i.e. the region's tokens already liked this UID, so they aren't reported as added.
+VERIFIED_LIKES_FRESHNESS = 60
+_uid_verified_cache = TTLCache(maxsize=UID_REGION_MAXSIZE, ttl=UID_REGION_TTL)
+
+# ASCII digits only; str.isdigit() also accepts other scripts' numerals.
+_UID_RE = re.compile(r"\A[0-9]{1,12}\Z")
+
+LIKE_CONCURRENCY = 64
+LIKE_TIMEOUT = SESSION_TIMEOUT
+LIKE_CACHE_CONTROL = "private, max-age=5"
+
+# Load balancers probe /health-check constantly; reuse the token status briefly.
+HEALTH_CACHE_TTL = 1.0
+_health_cache = (0.0, {})
+_health_lock = threading.Lock()
+
+# UID -> result future of the like_pipeline run currently serving it.
+_inflight: dict = {}
+_inflight_lock = threading.Lock()
+
+
+# ------------------ SESSION ------------------ #
+def _get_io_loop() -> asyncio.AbstractEventLoop:
+    global _IO_LOOP
+    with _IO_LOCK:
+        if _IO_LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="like-io-loop", daemon=True).start()
+            _IO_LOOP = loop
+    return _IO_LOOP
+
+
+def _run_io(coro):
+    """Schedule coro on the IO loop and return an awaitable for the caller's loop."""
+    return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, _get_io_loop()))
+
+
+def _get_session() -> aiohttp.ClientSession:
+    """Return the process-wide session. Must be called from the IO loop."""
+    global _SESSION
+    if _SESSION is None or _SESSION.closed:
+        try:
+            resolver = aiohttp.AsyncResolver()
+        except Exception as e:
+            logger.warning(f"aiodns resolver unavailable, using default resolver: {str(e)}")
+            resolver = None
+        connector = aiohttp.TCPConnector(
+            resolver=resolver,
+            use_dns_cache=True,
+            limit=1000,
+            limit_per_host=200,
+            ttl_dns_cache=600,
+            keepalive_timeout=60,
+            enable_cleanup_closed=True,
+        )
+        _SESSION = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=SESSION_TIMEOUT))
+    return _SESSION
+
+
+async def _close_session():
+    if _SESSION is not None and not _SESSION.closed:
+        await _SESSION.close()
+
+
+def _shutdown_io():
+    if _IO_LOOP is None:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_close_session(), _IO_LOOP).result(timeout=5)
+    except Exception as e:
+        logger.error(f"Failed to close HTTP session: {str(e)}")
+    _IO_LOOP.call_soon_threadsafe(_IO_LOOP.stop)
+
+
+async def _post(url: str, data: bytes, headers: dict):
+    async with _get_session().post(url, data=data, headers=headers) as resp:
+        return await resp.read()
+
+
+async def _post_with_status(url: str, data: bytes, headers: dict):
+    async with _get_session().post(url, data=data, headers=headers) as resp:
+        return resp.status, await resp.read()
+
+
+# ------------------ UID REGION CACHE ------------------ #
+def _remember_region(uid: str, region: str):
+    with _uid_region_lock:
+        _uid_region_cache[uid] = region
+
+
+def _cached_region(uid: str):
+    with _uid_region_lock:
+        return _uid_region_cache.get(uid)
+
+
+def _remember_verified(uid: str, region: str, player_info, tokens_spent: bool):
+    with _uid_region_lock:
+        _uid_verified_cache[uid] = (
+            region,
+            player_info.AccountInfo.PlayerNickname,
+            player_info.AccountInfo.Likes,
+            tokens_spent,
+            time.monotonic(),
+        )
+
+
+def _cached_verified(uid: str, region: str):
+    with _uid_region_lock:
+        entry = _uid_verified_cache.get(uid)
+    return entry if entry and entry[0] == region else None
+
+
+def _invalidate_uid(uid: str):
+    with _uid_region_lock:
+        _uid_region_cache.pop(uid, None)
+        _uid_verified_cache.pop(uid, None)
+
+
+def _invalidate_region(region: str):
+    """Evict every cached UID routed to region, e.g. after its tokens all died."""
+    with _uid_region_lock:
+        stale = [uid for uid, cached in _uid_region_cache.items() if cached == region]
+        for uid in stale:
+            _uid_region_cache.pop(uid, None)
+            _uid_verified_cache.pop(uid, None)
+    if stale:
+        logger.info(f"Invalidated {len(stale)} cached UIDs for region {region}")
+
 
 # ------------------ HELPERS ------------------ #
+def _get_token_status():
+    global _health_cache
+    with _health_lock:
+        ts, token_status = _health_cache
+        now = time.monotonic()
+        if now - ts < HEALTH_CACHE_TTL:
+            return token_status
+        token_status = {
+            server: len(_token_cache.get_tokens(server)) > 0
+            for server in _SERVERS
+        }
+        _health_cache = (now, token_status)
+        return token_status
+
+
+def _json(obj, status: int = 200) -> Response:
+    return Response(orjson.dumps(obj), status=status, mimetype="application/json")
+
+
 async def async_post_request(url: str, data: bytes, token: str):
     try:
-        headers = get_headers(token)
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, data=data, headers=headers, timeout=10) as resp:
-                return await resp.read()
+        return await _run_io(_post(url, data, get_headers(token)))
     except Exception as e:
         logger.error(f"Async request failed: {str(e)}")
         return None
 
 
-def make_request(uid_enc: str, url: str, token: str):
-    data = bytes.fromhex(uid_enc)
+async def make_request_async(uid_data: bytes, url: str, token: str):
     headers = get_headers(token)
     try:
-        response = requests.post(url, headers=headers, data=data, timeout=10)
-        if response.status_code == 200:
-            return decode_info(response.content)
-        logger.warning(f"Request failed with status {response.status_code}")
+        status, body = await _run_io(_post_with_status(url, uid_data, headers))
+        if status == 200:
+            return decode_info(body)
+        logger.warning(f"Request failed with status {status}")
         return None
     except Exception as e:
         logger.error(f"Request error: {str(e)}")
         return None
 
 
-async def detect_player_region(uid: str):
-    """Try all servers until UID is found."""
-    for region_key, server_url in _SERVERS.items():
+async def _probe_region(region_key: str, info_url: str, uid_data: bytes, token: str):
+    response = await async_post_request(info_url, uid_data, token)
+    if not response:
+        return region_key, None
+    try:
+        player_info = decode_info(response)
+    except Exception as e:
+        logger.error(f"Probe decode failed for {region_key}: {str(e)}")
+        return region_key, None
+    if player_info and player_info.AccountInfo.PlayerNickname:
+        return region_key, player_info
+    return region_key, None
+
+
+async def detect_player_region(uid_data: bytes):
+    """Probe all servers concurrently and return the first one that knows the UID."""
+    tasks = []
+    for region_key, info_url in _INFO_URLS.items():
         tokens = _token_cache.get_tokens(region_key)
         if not tokens:
             continue
+        tasks.append(asyncio.create_task(_probe_region(region_key, info_url, uid_data, tokens[0])))
 
-        info_url = f"{server_url}/GetPlayerPersonalShow"
-        response = await async_post_request(info_url, bytes.fromhex(encode_uid(uid)), tokens[0])
-        if response:
-            player_info = decode_info(response)
-            if player_info and player_info.AccountInfo.PlayerNickname:
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            region_key, player_info = await next_done
+            if player_info:
                 return region_key, player_info
-    return None, None
+        return None, None
+    finally:
+        pending = [t for t in tasks if not t.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def lookup_player(uid: str, uid_data: bytes):
+    """Resolve (region, nickname, likes) for the UID, using the caches before detection."""
+    region = _cached_region(uid)
+    if region and region in _INFO_URLS:
+        verified = _cached_verified(uid, region)
+        if verified and time.monotonic() - verified[4] < VERIFIED_LIKES_FRESHNESS:
+            return region, verified[1], verified[2]
+
+        tokens = _token_cache.get_tokens(region)
+        if tokens:
+            player_info = await make_request_async(uid_data, _INFO_URLS[region], tokens[0])
+            if player_info and player_info.AccountInfo.PlayerNickname:
+                return region, player_info.AccountInfo.PlayerNickname, player_info.AccountInfo.Likes
+        _invalidate_uid(uid)
+
+    region, player_info = await detect_player_region(uid_data)
+    if not player_info:
+        return None, None, None
+    _remember_region(uid, region)
+    return region, player_info.AccountInfo.PlayerNickname, player_info.AccountInfo.Likes
+
+
+async def _reconcile(uid: str, uid_data: bytes, region: str, token: str, before_likes: int):
+    """Fetch the real post-send count and record whether the likes actually landed."""
+    player_info = await make_request_async(uid_data, _INFO_URLS[region], token)
+    if player_info and player_info.AccountInfo.PlayerNickname:
+        tokens_spent = player_info.AccountInfo.Likes <= before_likes
+        _remember_verified(uid, region, player_info, tokens_spent)
+
+
+def _make_send_likes(region: str, like_url: str):
+    """Build the like sender for one region with its URL and static headers bound."""
+    base_headers = get_headers("")
+
+    async def send(uid: str, tokens: list):
+        payload = bytes.fromhex(encrypt_aes(create_protobuf(uid, region)))
+        sem = asyncio.Semaphore(LIKE_CONCURRENCY)
+
+        async def _with_timeout(token: str):
+            # Each post gets its own deadline and swallows its own failure, so one
+            # slow token cannot cancel the rest of the group.
+            async with sem:
+                try:
+                    async with asyncio.timeout(LIKE_TIMEOUT):
+                        headers = {**base_headers, "Authorization": f"Bearer {token}"}
+                        status, _ = await _run_io(_post_with_status(like_url, payload, headers))
+                        return status
+                except TimeoutError:
+                    logger.warning(f"Like request timed out for region {region}")
+                    return None
+                except Exception as e:
+                    logger.error(f"Like request failed for region {region}: {str(e)}")
+                    return None
+
+        async with asyncio.TaskGroup() as tg:
+            tasks = [tg.create_task(_with_timeout(token)) for token in tokens]
+        results = [task.result() for task in tasks]
+
+        return {
+            "sent": len(results),
+            "added": sum(1 for status in results if status == 200)
+        }
+
+    return send
 
 
 async def send_likes(uid: str, region: str):
@@ -66,61 +330,43 @@ async def send_likes(uid: str, region: str):
     if not tokens:
         logger.warning(f"No tokens available for region {region}, skipping like send.")
         return {"sent": 0, "added": 0}
+    return await _SEND_LIKES[region](uid, tokens)
 
-    like_url = f"{_SERVERS[region]}/LikeProfile"
-    encrypted = encrypt_aes(create_protobuf(uid, region))
-
-    tasks = [async_post_request(like_url, bytes.fromhex(encrypted), token) for token in tokens]
-    results = await asyncio.gather(*tasks)
 
-    return {
-        "sent": len(results),
-        "added": sum(1 for r in results if r is not None)
-    }
-
-
-# ------------------ ROUTES ------------------ #
-@like_bp.route("/like", methods=["GET"])
-async def like_player():
+# ------------------ PIPELINE ------------------ #
+async def like_pipeline(uid: str):
+    """Run detection and likes for a UID. Returns (body, status)."""
     try:
-        uid = request.args.get("uid")
-        if not uid or not uid.isdigit():
-            return jsonify({
-                "error": "Invalid UID",
-                "message": "Valid numeric UID required",
-                "status": 400,
-                "credits": "https://t.me/nopethug"
-            }), 400
+        uid_data = bytes.fromhex(encode_uid(uid))
 
         # Detect region
-        region, player_info = await detect_player_region(uid)
-        if not player_info:
-            return jsonify({
+        region, player_name, before_likes = await lookup_player(uid, uid_data)
+        if not region:
+            return {
                 "error": "Player not found",
                 "message": "Player not found on any server",
                 "status": 404,
                 "credits": "https://t.me/nopethug"
-            }), 404
-
-        before_likes = player_info.AccountInfo.Likes
-        player_name = player_info.AccountInfo.PlayerNickname
-        info_url = f"{_SERVERS[region]}/GetPlayerPersonalShow"
+            }, 404
 
         # Try sending likes
         like_result = await send_likes(uid, region)
 
-        # If no tokens, we just return 0 added likes
-        if like_result["sent"] == 0:
-            after_likes = before_likes
-        else:
+        # A 200 from LikeProfile doesn't guarantee the like counted; trust it only
+        # until a reconcile shows this region's tokens have already liked the UID.
+        verified = _cached_verified(uid, region)
+        tokens_spent = bool(verified and verified[3])
+        after_likes = before_likes if tokens_spent else before_likes + like_result["added"]
+
+        # Check the real count in the background; the next request uses the result
+        if like_result["added"]:
             current_tokens = _token_cache.get_tokens(region)
-            if not current_tokens:
-                after_likes = before_likes
-            else:
-                new_info = make_request(encode_uid(uid), info_url, current_tokens[0])
-                after_likes = new_info.AccountInfo.Likes if new_info else before_likes
+            if current_tokens:
+                asyncio.run_coroutine_threadsafe(
+                    _reconcile(uid, uid_data, region, current_tokens[0], before_likes), _get_io_loop()
+                )
 
-        return jsonify({
+        return {
             "player": player_name,
             "uid": uid,
             "likes_added": after_likes - before_likes,
@@ -129,44 +375,102 @@ async def like_player():
             "server_used": region,
             "status": 1 if after_likes > before_likes else 2,
             "credits": "https://t.me/nopethug"
-        })
+        }, 200
 
     except Exception as e:
         logger.error(f"Like error for UID {uid}: {str(e)}", exc_info=True)
-        return jsonify({
+        return {
             "error": "Internal server error",
             "message": str(e),
             "status": 500,
             "credits": "https://t.me/nopethug"
-        }), 500
+        }, 500
+
+
+async def coalesced_like_pipeline(uid: str):
+    """Share one like_pipeline run between concurrent requests for the same UID."""
+    with _inflight_lock:
+        shared = _inflight.get(uid)
+        owner = shared is None
+        if owner:
+            shared = _inflight[uid] = concurrent.futures.Future()
+
+    if not owner:
+        # Shield so a cancelled waiter doesn't cancel the result other requests share.
+        return await asyncio.shield(asyncio.wrap_future(shared))
+
+    try:
+        result = await like_pipeline(uid)
+        if not shared.done():
+            shared.set_result(result)
+        return result
+    except BaseException as e:
+        if not shared.done():
+            shared.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(uid, None)
+
+
+# ------------------ ROUTES ------------------ #
+@like_bp.route("/like", methods=["GET"])
+async def like_player():
+    uid = request.args.get("uid") or ""
+    if not _UID_RE.match(uid):
+        return _json({
+            "error": "Invalid UID",
+            "message": "Valid numeric UID required",
+            "status": 400,
+            "credits": "https://t.me/nopethug"
+        }, 400)
+
+    body, status = await coalesced_like_pipeline(uid)
+    if status != 200:
+        return _json(body, status)
+
+    payload = orjson.dumps(body)
+    etag = hashlib.md5(payload).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(payload, status=status, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = LIKE_CACHE_CONTROL
+    return resp
 
 
 @like_bp.route("/health-check", methods=["GET"])
 def health_check():
     try:
-        token_status = {
-            server: len(_token_cache.get_tokens(server)) > 0
-            for server in _SERVERS
-        }
+        token_status = _get_token_status()
+        # Weak: the body also carries a timestamp that the tag doesn't cover
+        etag = hashlib.md5(orjson.dumps(token_status, option=orjson.OPT_SORT_KEYS)).hexdigest()
+        if request.if_none_match.contains_weak(etag):
+            resp = Response(status=304)
+            resp.set_etag(etag, weak=True)
+            return resp
 
-        return jsonify({
+        resp = _json({
             "status": "healthy" if all(token_status.values()) else "degraded",
             "servers": token_status,
             "timestamp": datetime.now(timezone.utc).isoformat(),
             "credits": "https://t.me/nopethug"
         })
+        resp.set_etag(etag, weak=True)
+        return resp
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
-        return jsonify({
+        return _json({
             "status": "unhealthy",
             "error": str(e),
             "credits": "https://t.me/nopethug"
-        }), 500
+        }, 500)
 
 
 @like_bp.route("/", methods=["GET"])
 async def root_home():
-    return jsonify({
+    return _json({
         "message": "Api free fire like",
         "credits": "https://t.me/nopethug",
     })
@@ -174,7 +478,12 @@ async def root_home():
 
 # ------------------ INITIALIZER ------------------ #
 def initialize_routes(app_instance, servers_config, token_cache_instance):
-    global _SERVERS, _token_cache
+    global _SERVERS, _INFO_URLS, _LIKE_URLS, _SEND_LIKES, _token_cache
     _SERVERS = servers_config
+    _INFO_URLS = {region: f"{url}/GetPlayerPersonalShow" for region, url in servers_config.items()}
+    _LIKE_URLS = {region: f"{url}/LikeProfile" for region, url in servers_config.items()}
+    _SEND_LIKES = {region: _make_send_likes(region, url) for region, url in _LIKE_URLS.items()}
     _token_cache = token_cache_instance
+    _token_cache.add_invalidation_listener(_invalidate_region)
     app_instance.register_blueprint(like_bp)
+    atexit.register(_shutdown_io)
@@ -21,8 +21,21 @@ class TokenCache:
         self.lock = threading.Lock()
         self.session = requests.Session()
         self.servers_config = servers_config
+        self.invalidation_listeners = []
+
+    def add_invalidation_listener(self, callback):
+        """Register callback(server_key), called when a server is left with no tokens."""
+        self.invalidation_listeners.append(callback)
+
+    def _notify_invalidation(self, server_key):
+        for callback in self.invalidation_listeners:
+            try:
+                callback(server_key)
+            except Exception as e:
+                logger.error(f"Invalidation listener failed for {server_key}: {str(e)}")
 
     def get_tokens(self, server_key):
+        tokens_lost = False
         with self.lock:
             now = time.time()
             refresh_needed = (
@@ -32,12 +45,18 @@ class TokenCache:
             )
 
             if refresh_needed:
-                self._refresh_tokens(server_key)
+                tokens_lost = self._refresh_tokens(server_key)
                 self.last_refresh[server_key] = now
 
-            return self.cache.get(server_key, [])
+            tokens = self.cache.get(server_key, [])
+
+        # Listeners run outside the lock so they can't stall or deadlock other callers
+        if tokens_lost:
+            self._notify_invalidation(server_key)
+        return tokens
 
     def _refresh_tokens(self, server_key):
+        """Refresh tokens for server_key. Returns True if the server was left with none."""
         try:
             creds = self._load_credentials(server_key)
             tokens = []
@@ -62,11 +81,13 @@ class TokenCache:
             else:
                 logger.warning(f"No valid tokens retrieved for {server_key}. Clearing cache for this server.")
                 self.cache[server_key] = []
+                return True
 
         except Exception as e:
             logger.error(f"Critical error during token refresh for {server_key}: {str(e)}")
             if server_key not in self.cache:
                 self.cache[server_key] = []
+        return False
 
     def _load_credentials(self, server_key):
         try:
@@ -3,11 +3,15 @@ import app.protobuf.uid_generator_pb2 as uid_generator_pb2
 import app.protobuf.like_pb2 as like_pb2
 import app.protobuf.like_count_pb2 as like_count_pb2
 from google.protobuf.message import DecodeError
+from google.protobuf.internal import api_implementation
 import logging
 from .crypto_utils import encrypt_aes # Import relatif puisque crypto_utils.py est dans le même dossier
 
 logger = logging.getLogger(__name__)
 
+if api_implementation.Type() == "python":
+    logger.warning("protobuf is using the pure-Python backend; install a protobuf>=4.25 binary wheel for native decoding")
+
 def create_protobuf(uid: str, region=None):
     if region:
         msg = like_pb2.like()